@@ -8,7 +8,15 @@ setup(
     version='0.2',
     packages=find_packages(),
     install_requires=requirements,
+    extras_require=dict(server=[
+        'waitress>=2.0.0',
+        'pyarrow>=3.0.0',
+        'brotli>=1.0.0'
+    ], sql=[
+        'duckdb>=0.9.0'
+    ]),
     entry_points=dict(console_scripts=[
-        'x4stats=stats.app:main'
+        'x4stats=stats.app:main',
+        'x4stats-server=stats.server:main'
     ])
 )
@@ -1,8 +1,19 @@
 from flask import Flask
 from flask import render_template
+from flask import Response
+from flask import request
+from flask import jsonify
+from flask import abort
 from stats.x4stats import X4stats
-import plotly.graph_objects as go
+from stats.charts import render_stats, render_transactions, render_fleet, render_idle, render_timeline, \
+    render_timeline_data, render_changes, get_live_profit_per_commander, TIMELINE_POINTS
+from stats import changes
+from stats.workers import RenderPool
+from stats.live import LiveFeed
+from stats.sql import SqlEngine, SqlError
+from stats.httpcache import ResponseCache
 from flask_bootstrap import Bootstrap
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
 from pathlib import Path
 
 app = Flask(__name__)
@@ -12,12 +23,6 @@ app.template_folder = 'templates'
 app.static_folder = 'static'
 Bootstrap(app)
 
-colors = {
-    'background': '#0a0a0a',
-    'text': '#FFFFFF'
-}
-colors_bar = ['#005e85', '#f27800', '#c90c0f', '#85858b', '#eaaf32', '#f08971', '#cbcbd4']
-
 # Check config
 save_location = app.config["SAVE_LOCATION"]
 p = Path(save_location)
@@ -29,225 +34,57 @@ if not p.exists():
 x4stats = X4stats(
     save_location=save_location
 )
+if app.config.get("SNAPSHOT", False):
+    x4stats.enable_snapshots()
+# Renders in this process. Spawned render workers import the main module again, which must not import this module
+# since it loads the save, so only x4stats-server starts workers, see stats/server.py
+render_pool = RenderPool(
+    x4stats=x4stats,
+    workers=0
+)
+sql_engine = SqlEngine(
+    x4stats=x4stats,
+    max_rows=app.config.get("SQL_MAX_ROWS", 10000),
+    timeout=app.config.get("SQL_TIMEOUT_SECONDS", 10)
+)
+live_feed = LiveFeed(
+    x4stats=x4stats,
+    poll_seconds=app.config.get("LIVE_POLL_SECONDS", 10),
+    max_listeners=app.config.get("LIVE_MAX_CLIENTS", 4)
+)
+# pages are rendered once per loaded save and url, browsers revalidate with the version token of the save as etag
+response_cache = ResponseCache(
+    token=lambda: x4stats.version_token,
+    max_entries=app.config.get("HTTP_CACHE_ENTRIES", 64)
+)
 
 
-def get_ware_sales_pie(df):
-    ware_sales_pie = go.Figure(
-        data=[go.Pie(
-            labels=df.ware,
-            values=df.sales,
-        )])
-    ware_sales_pie.update_layout(
-        title='Wares sold',
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text'],
-        separators='.,',
-    )
-    ware_sales_pie.update_traces(textposition='inside')
-    return ware_sales_pie.to_html()
-
-
-def get_ware_costs_pie(df):
-    ware_costs_pie = go.Figure(
-        data=[go.Pie(
-            labels=df.ware,
-            values=df.costs,
-        )])
-    ware_costs_pie.update_layout(
-        title='Wares bought',
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text'],
-        separators='.,',
-    )
-    ware_costs_pie.update_traces(textposition='inside')
-    return ware_costs_pie.to_html()
-
-
-def get_profit_per_commander(df):
-    profit_commander = go.Figure()
-    profit_commander.add_trace(
-        go.Histogram(
-            x=df.commander_name,
-            y=df.value,
-            histfunc="sum",
-            marker={"color": colors_bar[2]},
-        )
-    )
-    profit_commander.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text'],
-        height=900,
-        title='Ship and station trade value including subordinates',
-        separators='.,',
-        yaxis=dict(
-            title="profitss",
-        ),
-        xaxis=dict(
-            title="commander",
-            rangeslider=dict(
-                visible=True
-            ),
-            type='category'
-        )
-    )
-    return profit_commander.to_html()
-
-
-def get_scatter_margin_profit(df):
-    fig = go.Figure()
+@app.route('/', methods=['GET'])
+def index():
+    return ''
 
-    # Add traces
-    fig.add_trace(
-        go.Scatter(
-            x=df["value"],
-            y=df["margin"],
-            mode='markers',
-            name='markers',
-            text=df["commander_name"]
-        )
-    )
-    fig.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        font_color=colors['text'],
-        height=900,
-        title='Profit (x-axis) and margin (y-axis) including subordinates',
-        xaxis_showgrid=False,
-        yaxis_showgrid=False,
-        separators='.,',
-    )
-    return fig.to_html()
-
-
-def get_table_inactive_traders_miners(df):
-    fig = go.Figure(data=[go.Table(
-        header=dict(values=list(['commander_name', 'default_order', 'ship_code', 'ship_name', 'ship_type'
-                                    , 'value', 'volume']),
-                    fill_color=colors['background'],
-                    font_color=colors['text'],
-                    line_color='darkslategray',
-                    align='left'),
-        cells=dict(
-            values=[
-                df["commander_name"]
-                , df["default_order"]
-                , df["ship_code"]
-                , df["ship_name"]
-                , df["ship_type"]
-                , df["value"].apply(number_formatter)
-                , df["volume"].apply(number_formatter)
-            ],
-            fill_color=colors['background'],
-            font_color=colors['text'],
-            line_color='darkslategray',
-            align='left'))
-    ])
-    fig.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        height=330,
 
-    )
-    return fig.to_html()
-
-
-def get_table_per_ship(df):
-    fig = go.Figure(data=[go.Table(
-        header=dict(values=list(df.columns),
-                    fill_color=colors['background'],
-                    font_color=colors['text'],
-                    line_color='darkslategray',
-                    align='left'),
-        cells=dict(
-            values=[
-                df["ship_id"]
-                , df["ship_class"]
-                , df["commander_name"]
-                , df["default_order"]
-                , df["ship_code"]
-                , df["ship_name"]
-                , df["ship_type"]
-                , df["value"].apply(number_formatter)
-                , df["sales"].apply(number_formatter)
-                , df["costs"].apply(number_formatter)
-                , df["volume"].apply(number_formatter)
-                , df["margin"]
-               ],
-            fill_color=colors['background'],
-            font_color=colors['text'],
-            line_color='darkslategray',
-            align='left')),
-    ])
-    fig.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        height=900,
-    )
-    return fig.to_html()
-
-
-def get_transactions_per_ship(df):
-    cols = ["name", "code", "commander", "time", "hours_since_event", "ware", "value", "volume"]
-    fig = go.Figure(data=[go.Table(
-        header=dict(values=list(cols),
-                    fill_color=colors['background'],
-                    font_color=colors['text'],
-                    line_color='darkslategray',
-                    align='left'),
-        cells=dict(
-            values=[
-                df["ship_name"]
-                , df["ship_code"]
-                , df["commander_name"]
-                , df["time"]
-                , df["hours_since_event"]
-                , df["ware"]
-                , df["value"].apply(number_formatter)
-                , df["volume"].apply(number_formatter)
-            ],
-            fill_color=colors['background'],
-            font_color=colors['text'],
-            line_color='darkslategray',
-            align='left'))
-    ])
-    fig.update_layout(
-        plot_bgcolor=colors['background'],
-        paper_bgcolor=colors['background'],
-        height=900,
+plotly_js = get_plotlyjs()
+plotly_cache = ResponseCache(
+    token=get_plotlyjs_version,
+    cache_control='public, max-age=86400'
+)
 
 
+@app.route('/plotly.min.js', methods=['GET'])
+@plotly_cache.cached
+def plotly():
+    return Response(
+        plotly_js,
+        mimetype='application/javascript',
     )
-    return fig.to_html()
-
-
-def number_formatter(n):
-    return f'{int(n):,}'.replace(',', '.')
-
-
-@app.route('/', methods=['GET'])
-def index():
-    return ''
 
 
 @app.route('/stats', methods=['GET'])
 @app.route('/stats/<hours>', methods=['GET'])
+@response_cache.cached
 def stats(hours=None):
-    df_sales = x4stats.get_df_sales(hours, filter_zero_value=True)
-    df_per_ship = x4stats.get_df_per_ship(hours)
-    df_per_commander = x4stats.get_df_per_commander(hours)
-    df_inactive_traders = x4stats.get_idle_traders_miners(hours)
-
-    game_time = str(round(x4stats.get_game_time() / 3600, 2))
-    profit = f'{int(x4stats.get_profit(df_sales)):,}'.replace(',', '.')
-    w_sales_pie = get_ware_sales_pie(df_sales)
-    w_costs_pie = get_ware_costs_pie(df_sales)
-    profit_histogram = get_profit_per_commander(df_sales)
-    scatter_margin_profit = get_scatter_margin_profit(df_per_commander)
-    inactive_traders = get_table_inactive_traders_miners(df_inactive_traders)
-    table_per_ship = get_table_per_ship(df_per_ship)
+    charts = render_pool.run(render_stats, hours)
 
     hours_par = "all time"
     hours_raw = ''
@@ -256,24 +93,17 @@ def stats(hours=None):
         hours_raw = hours
     return render_template(
         'index.html',
-        profit_histogram=profit_histogram,
-        w_sales_pie=w_sales_pie,
-        w_costs_pie=w_costs_pie,
-        scatter_margin_profit=scatter_margin_profit,
-        game_time=game_time,
-        profit=profit,
         hours=hours_par,
         hours_raw=hours_raw,
-        inactive_traders=inactive_traders,
-        table_per_ship=table_per_ship,
+        **charts
     )
 
 
 @app.route('/transactions', methods=['GET'])
 @app.route('/transactions/<hours>', methods=['GET'])
+@response_cache.cached
 def transactions(hours=None):
-    df_sales = x4stats.get_df_sales_sorted(hours, filter_zero_value=True)
-    transactions_per_ship = get_transactions_per_ship(df_sales)
+    charts = render_pool.run(render_transactions, hours)
     hours_par = "all time"
     hours_raw = ''
     if hours:
@@ -281,10 +111,137 @@ def transactions(hours=None):
         hours_raw = hours
     return render_template(
         'transactions.html',
-        transactions_per_ship=transactions_per_ship,
         hours=hours_par,
         hours_raw=hours_raw,
+        **charts
+    )
+
+
+@app.route('/idle', methods=['GET'])
+@app.route('/idle/<hours>', methods=['GET'])
+@response_cache.cached
+def idle(hours=None):
+    charts = render_pool.run(render_idle, hours)
+    hours_par = "all time"
+    hours_raw = ''
+    if hours:
+        hours_par = "past " + str(hours) + " hours"
+        hours_raw = hours
+    return render_template(
+        'idle.html',
+        hours=hours_par,
+        hours_raw=hours_raw,
+        **charts
+    )
+
+
+@app.route('/fleet', methods=['GET'])
+@app.route('/fleet/<commander_id>', methods=['GET'])
+@app.route('/fleet/<commander_id>/<hours>', methods=['GET'])
+@response_cache.cached
+def fleet(commander_id=None, hours=None):
+    if commander_id == 'all':
+        commander_id = None
+    if commander_id and commander_id not in x4stats.fleet.index:
+        abort(404)
+    charts = render_pool.run(render_fleet, commander_id, hours)
+
+    hours_par = "all time"
+    hours_raw = ''
+    if hours:
+        hours_par = "past " + str(hours) + " hours"
+        hours_raw = hours
+    return render_template(
+        'fleet.html',
+        hours=hours_par,
+        hours_raw=hours_raw,
+        **charts
+    )
+
+
+@app.route('/timeline', methods=['GET'])
+@app.route('/timeline/<commander_id>', methods=['GET'])
+@response_cache.cached
+def timeline(commander_id=None):
+    if commander_id == 'all':
+        commander_id = None
+    if commander_id and commander_id not in x4stats.fleet.index:
+        abort(404)
+    charts = render_pool.run(render_timeline, commander_id)
+    return render_template(
+        'timeline.html',
+        commander_id=commander_id or 'all',
+        **charts
+    )
+
+
+# Timeline series as json for the game hours start to end, used when zooming in on the timeline
+@app.route('/api/timeline', methods=['GET'])
+@app.route('/api/timeline/<commander_id>', methods=['GET'])
+@response_cache.cached
+def timeline_data(commander_id=None):
+    if commander_id == 'all':
+        commander_id = None
+    if commander_id and commander_id not in x4stats.fleet.index:
+        abort(404)
+    start = request.args.get('start', type=float)
+    end = request.args.get('end', type=float)
+    points = min(request.args.get('points', TIMELINE_POINTS, type=int), 5000)
+    return jsonify(render_pool.run(render_timeline_data, commander_id, start, end, points))
+
+
+# Read only sql query over the sales, assets and activity tables, eg:
+# /api/sql?q=select ware, sum(value) from sales where hours_since_event < 5 group by ware
+@app.route('/api/sql', methods=['GET', 'POST'])
+def sql():
+    query = request.values.get('q')
+    if not query:
+        return jsonify(error='No query given, use parameter q'), 400
+    try:
+        return jsonify(sql_engine.query(query, request.values.get('limit', type=int)))
+    except SqlError as e:
+        return jsonify(error=str(e)), 400
+
+
+# The change sets are only kept by this process, so they are rendered here instead of in the render pool
+@app.route('/changes', methods=['GET'])
+@response_cache.cached
+def changes_view():
+    return render_template(
+        'changes.html',
+        **render_changes(x4stats)
+    )
+
+
+@app.route('/api/changes', methods=['GET'])
+@response_cache.cached
+def changes_data():
+    return jsonify([changes.to_dict(c) for c in x4stats.get_changes()])
+
+
+@app.route('/live', methods=['GET'])
+def live():
+    live_feed.start()
+    return render_template(
+        'live.html',
+        game_time=str(round(x4stats.get_game_time() / 3600, 2)),
+        live_profit_per_commander=get_live_profit_per_commander(),
+    )
+
+
+@app.route('/live/events', methods=['GET'])
+def live_events():
+    # an event stream holds a server thread as long as the page is open
+    if not live_feed.connect():
+        return Response('Too many live pages open', status=503, headers={'Retry-After': '30'})
+    live_feed.start()
+    response = Response(
+        live_feed.listen(),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache'},
     )
+    response.call_on_close(live_feed.disconnect)
+    return response
 
 
 @app.route('/reload', methods=['GET'])
@@ -0,0 +1,84 @@
+import numpy as np
+import pandas as pd
+
+STATE_COLUMNS = ["name", "code", "class", "commander_id", "commander_name", "default_order"]
+
+
+# Ships and stations of a loaded save as arrays sorted by id, so two saves can be compared with array operations
+def fleet_state(ships, sales, game_time):
+    ids = np.array([s["id"] for s in ships], dtype=object)
+    order = np.argsort(ids, kind="mergesort")
+    state = {
+        "game_time": game_time,
+        "id": ids[order],
+        "lost": np.array([bool(s.get("lost")) for s in ships], dtype=bool)[order],
+    }
+    for col in STATE_COLUMNS:
+        state[col] = np.array([s[col] for s in ships], dtype=object)[order]
+    # trade value per asset, for the value of lost ships
+    value = sales.groupby("ship_id")["value"].sum()
+    state["value"] = value.reindex(state["id"]).fillna(0).to_numpy()
+    return state
+
+
+# Changes between two fleet states: assets lost and built, reassigned commanders, changed default orders and the
+# trades per ship after the game time of the previous state. sales must be sorted by time.
+def diff(previous, current, sales):
+    prev_ids = previous["id"]
+    cur_ids = current["id"]
+    _, ip, ic = np.intersect1d(prev_ids, cur_ids, assume_unique=True, return_indices=True)
+
+    # lost ships are kept, so they are in both states. A lost ship showing up again counts as built.
+    new = np.ones(len(cur_ids), dtype=bool)
+    new[ic] = False
+    new[ic[previous["lost"][ip] & ~current["lost"][ic]]] = True
+    lost = ~previous["lost"][ip] & current["lost"][ic]
+    alive = ~previous["lost"][ip] & ~current["lost"][ic]
+    reassigned = alive & (previous["commander_id"][ip] != current["commander_id"][ic])
+    orders = alive & (previous["default_order"][ip] != current["default_order"][ic])
+
+    df_reassigned = _assets(current, ic[reassigned])
+    df_reassigned.insert(4, "old_commander_name", previous["commander_name"][ip[reassigned]])
+    df_reassigned = df_reassigned.rename(columns={"commander_name": "new_commander_name"})
+    df_orders = _assets(current, ic[orders])
+    df_orders.insert(4, "old_order", previous["default_order"][ip[orders]])
+    df_orders = df_orders.rename(columns={"default_order": "new_order"})
+    # lost assets with their commander and order in the previous save and their trade value including the new trades
+    df_lost = _assets(previous, ip[lost])
+    df_lost["value"] = current["value"][ic[lost]].round(0)
+
+    return {
+        "game_time": current["game_time"],
+        "previous_game_time": previous["game_time"],
+        "built": _assets(current, np.flatnonzero(new)),
+        "lost": df_lost,
+        "reassigned": df_reassigned,
+        "orders": df_orders,
+        "trades": _new_trades(sales, previous["game_time"]),
+    }
+
+
+def _assets(state, positions):
+    return pd.DataFrame({col: state[col][positions] for col in ["id"] + STATE_COLUMNS})
+
+
+# Number of trades and trade value per ship since game_time
+def _new_trades(sales, game_time):
+    start = np.searchsorted(sales["time"].to_numpy(), game_time, side="right")
+    df = sales.iloc[start:]
+    df = df.loc[df["volume"] != 0]
+    df_trades = df.groupby(["ship_id", "ship_name", "ship_code", "ship_class"], dropna=False)["value"] \
+        .agg(["count", "sum"]).reset_index()
+    df_trades.columns = ["id", "name", "code", "class", "trades", "value"]
+    df_trades["value"] = df_trades["value"].round(0)
+    return df_trades.sort_values("value", ascending=False).reset_index(drop=True)
+
+
+# Change set with the DataFrames as lists of records, for json
+def to_dict(change_set):
+    result = {}
+    for key, value in change_set.items():
+        if isinstance(value, pd.DataFrame):
+            value = value.astype(object).where(value.notna(), None).to_dict("records")
+        result[key] = value
+    return result
@@ -0,0 +1,446 @@
+import plotly.graph_objects as go
+import pandas as pd
+from stats.downsample import lttb
+
+colors = {
+    'background': '#0a0a0a',
+    'text': '#FFFFFF'
+}
+colors_bar = ['#005e85', '#f27800', '#c90c0f', '#85858b', '#eaaf32', '#f08971', '#cbcbd4']
+
+# Charts are html fragments without plotly.js, base.html loads it once per page
+
+# Number of wares in the pies, the remaining wares are combined into 'other'
+PIE_TOP_N = 15
+# Maximum number of points per line in the timeline
+TIMELINE_POINTS = 500
+
+
+# Keep the n rows with the highest value and sum the numeric columns of the rest into one row labeled 'other'
+def top_n(df, label, value, n):
+    if not n or len(df) <= n:
+        return df
+    df = df.sort_values(value, ascending=False)
+    other = df.iloc[n:].sum(numeric_only=True).to_frame().T
+    other[label] = 'other'
+    return pd.concat([df.iloc[:n], other], ignore_index=True)
+
+
+# df has one row per ware, see X4stats.get_df_per_ware
+def get_ware_sales_pie(df, n=PIE_TOP_N):
+    df = top_n(df, 'ware', 'sales', n)
+    ware_sales_pie = go.Figure(
+        data=[go.Pie(
+            labels=df.ware,
+            values=df.sales,
+        )])
+    ware_sales_pie.update_layout(
+        title='Wares sold',
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        separators='.,',
+    )
+    ware_sales_pie.update_traces(textposition='inside')
+    return ware_sales_pie.to_html(full_html=False, include_plotlyjs=False)
+
+
+def get_ware_costs_pie(df, n=PIE_TOP_N):
+    df = top_n(df, 'ware', 'costs', n)
+    ware_costs_pie = go.Figure(
+        data=[go.Pie(
+            labels=df.ware,
+            values=df.costs,
+        )])
+    ware_costs_pie.update_layout(
+        title='Wares bought',
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        separators='.,',
+    )
+    ware_costs_pie.update_traces(textposition='inside')
+    return ware_costs_pie.to_html(full_html=False, include_plotlyjs=False)
+
+
+# df has one row per commander, see X4stats.get_df_per_subtree
+def get_profit_per_commander(df, title='Ship and station trade value including subordinates', n=None):
+    df = top_n(df, 'commander_name', 'value', n)
+    profit_commander = go.Figure()
+    profit_commander.add_trace(
+        go.Bar(
+            x=df.commander_name + (' (' + df.ship_code + ')').fillna(''),
+            y=df.value,
+            customdata=df.subordinates,
+            hovertemplate='%{x}<br>value: %{y}<br>subordinates: %{customdata}<extra></extra>',
+            marker={"color": colors_bar[2]},
+        )
+    )
+    profit_commander.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        height=900,
+        title=title,
+        separators='.,',
+        yaxis=dict(
+            title="profitss",
+        ),
+        xaxis=dict(
+            title="commander",
+            rangeslider=dict(
+                visible=True
+            ),
+            type='category'
+        )
+    )
+    return profit_commander.to_html(full_html=False, include_plotlyjs=False)
+
+
+def get_profit_per_sector(df, title='Trade value per sector', n=None):
+    df = top_n(df, 'sector', 'value', n)
+    fig = go.Figure()
+    fig.add_trace(
+        go.Bar(
+            x=df.sector,
+            y=df.value,
+            customdata=df.trades,
+            hovertemplate='%{x}<br>value: %{y}<br>trades: %{customdata}<extra></extra>',
+            marker={"color": colors_bar[1]},
+        )
+    )
+    fig.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        height=600,
+        title=title,
+        separators='.,',
+        yaxis=dict(
+            title="profits",
+        ),
+        xaxis=dict(
+            title="sector",
+            type='category'
+        )
+    )
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+# Empty chart which the live page fills with the trades of every autosave
+def get_live_profit_per_commander():
+    fig = go.Figure()
+    fig.add_trace(
+        go.Bar(
+            x=[],
+            y=[],
+            marker={"color": colors_bar[0]},
+        )
+    )
+    fig.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        height=600,
+        title='Trade value per commander since this page was opened',
+        separators='.,',
+        xaxis=dict(
+            title="commander",
+            type='category'
+        )
+    )
+    return fig.to_html(full_html=False, include_plotlyjs=False, div_id='live_profit_per_commander')
+
+
+# Timeline series between game hours start and end, every line downsampled to at most points points. The first
+# series is the total, its hourly profit is included as well.
+def get_profit_timeline_data(df, start=None, end=None, points=TIMELINE_POINTS):
+    if start is not None:
+        df = df.loc[df["hour"] >= start]
+    if end is not None:
+        df = df.loc[df["hour"] <= end]
+    series = []
+    for series_id, df_series in df.groupby("series_id", sort=False):
+        hour = df_series["hour"].to_numpy()
+        cumulative = df_series["cumulative_profit"].to_numpy()
+        profit = df_series["profit"].to_numpy()
+        idx = lttb(hour, cumulative, points)
+        idx_hourly = lttb(hour, profit, points)
+        series.append({
+            "id": series_id,
+            "name": df_series["series_name"].iloc[0],
+            "cumulative": {"x": hour[idx].tolist(), "y": cumulative[idx].round(0).tolist()},
+            "hourly": {"x": hour[idx_hourly].tolist(), "y": profit[idx_hourly].round(0).tolist()},
+        })
+    return {"series": series}
+
+
+# Cumulative line and hourly values of every series, hourly values of the subordinates are hidden until clicked in
+# the legend. Every series has two traces in this order, the timeline page restyles them in the same order.
+def get_profit_timeline(data):
+    fig = go.Figure()
+    for i, s in enumerate(data["series"]):
+        if i == 0:
+            fig.add_trace(
+                go.Bar(
+                    x=s["hourly"]["x"],
+                    y=s["hourly"]["y"],
+                    name=s["name"] + ' per hour',
+                    marker={"color": colors_bar[3]},
+                    yaxis='y2',
+                )
+            )
+        else:
+            fig.add_trace(
+                go.Scatter(
+                    x=s["hourly"]["x"],
+                    y=s["hourly"]["y"],
+                    name=s["name"] + ' per hour',
+                    mode='lines',
+                    line={"color": colors_bar[i % len(colors_bar)], "width": 1, "dash": 'dot'},
+                    yaxis='y2',
+                    visible='legendonly',
+                )
+            )
+        fig.add_trace(
+            go.Scatter(
+                x=s["cumulative"]["x"],
+                y=s["cumulative"]["y"],
+                name=s["name"],
+                mode='lines',
+                line={"color": colors_bar[i % len(colors_bar)], "width": 3 if i == 0 else 1},
+            )
+        )
+    fig.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        height=900,
+        title='Cumulative trade value including subordinates',
+        separators='.,',
+        xaxis=dict(
+            title="game hour",
+        ),
+        yaxis=dict(
+            title="cumulative value",
+        ),
+        yaxis2=dict(
+            title="value per hour",
+            overlaying='y',
+            side='right',
+            showgrid=False,
+        ),
+    )
+    return fig.to_html(full_html=False, include_plotlyjs=False, div_id='profit_timeline')
+
+
+def get_scatter_margin_profit(df):
+    fig = go.Figure()
+
+    # Add traces
+    fig.add_trace(
+        go.Scatter(
+            x=df["value"],
+            y=df["margin"],
+            mode='markers',
+            name='markers',
+            text=df["commander_name"]
+        )
+    )
+    fig.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        font_color=colors['text'],
+        height=900,
+        title='Profit (x-axis) and margin (y-axis) including subordinates',
+        xaxis_showgrid=False,
+        yaxis_showgrid=False,
+        separators='.,',
+    )
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+def get_table_inactive_traders_miners(df, height=330):
+    fig = go.Figure(data=[go.Table(
+        header=dict(values=list(['commander_name', 'default_order', 'ship_code', 'ship_name', 'ship_type'
+                                    , 'last trade (hours ago)', 'trades', 'trades per hour']),
+                    fill_color=colors['background'],
+                    font_color=colors['text'],
+                    line_color='darkslategray',
+                    align='left'),
+        cells=dict(
+            values=[
+                df["commander_name"]
+                , df["default_order"]
+                , df["ship_code"]
+                , df["ship_name"]
+                , df["ship_type"]
+                , df["hours_since_last_trade"].apply(lambda h: 'never' if h != h else number_formatter(h))
+                , df["trades"].apply(number_formatter)
+                , df["trades_per_hour"]
+            ],
+            fill_color=colors['background'],
+            font_color=colors['text'],
+            line_color='darkslategray',
+            align='left'))
+    ])
+    fig.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        height=height,
+
+    )
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+def get_table_per_ship(df):
+    fig = go.Figure(data=[go.Table(
+        header=dict(values=list(df.columns),
+                    fill_color=colors['background'],
+                    font_color=colors['text'],
+                    line_color='darkslategray',
+                    align='left'),
+        cells=dict(
+            values=[
+                df["ship_id"]
+                , df["ship_class"]
+                , df["commander_name"]
+                , df["default_order"]
+                , df["ship_code"]
+                , df["ship_name"]
+                , df["ship_type"]
+                , df["value"].apply(number_formatter)
+                , df["sales"].apply(number_formatter)
+                , df["costs"].apply(number_formatter)
+                , df["volume"].apply(number_formatter)
+                , df["margin"]
+               ],
+            fill_color=colors['background'],
+            font_color=colors['text'],
+            line_color='darkslategray',
+            align='left')),
+    ])
+    fig.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        height=900,
+    )
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+def get_transactions_per_ship(df):
+    cols = ["name", "code", "commander", "time", "hours_since_event", "ware", "value", "volume"]
+    fig = go.Figure(data=[go.Table(
+        header=dict(values=list(cols),
+                    fill_color=colors['background'],
+                    font_color=colors['text'],
+                    line_color='darkslategray',
+                    align='left'),
+        cells=dict(
+            values=[
+                df["ship_name"]
+                , df["ship_code"]
+                , df["commander_name"]
+                , df["time"]
+                , df["hours_since_event"]
+                , df["ware"]
+                , df["value"].apply(number_formatter)
+                , df["volume"].apply(number_formatter)
+            ],
+            fill_color=colors['background'],
+            font_color=colors['text'],
+            line_color='darkslategray',
+            align='left'))
+    ])
+    fig.update_layout(
+        plot_bgcolor=colors['background'],
+        paper_bgcolor=colors['background'],
+        height=900,
+
+
+    )
+    return fig.to_html(full_html=False, include_plotlyjs=False)
+
+
+def number_formatter(n):
+    return f'{int(n):,}'.replace(',', '.')
+
+
+
+# Everything below builds the charts for one page. They only depend on the loaded X4stats data, so they can run in
+# a render worker process as well as in the web server itself.
+def render_stats(x4stats, hours=None):
+    df_sales = x4stats.get_df_sales(hours, filter_zero_value=True)
+    df_per_ship = x4stats.get_df_per_ship(hours)
+    df_per_commander = x4stats.get_df_per_commander(hours)
+    df_inactive_traders = x4stats.get_inactive_ships(hours)
+    df_per_subtree = x4stats.get_df_per_subtree(hours)
+    df_per_ware = x4stats.get_df_per_ware(hours)
+    df_per_sector = x4stats.get_df_per_sector(hours)
+
+    return dict(
+        game_time=str(round(x4stats.get_game_time() / 3600, 2)),
+        profit=number_formatter(x4stats.get_profit(df_sales)),
+        w_sales_pie=get_ware_sales_pie(df_per_ware),
+        w_costs_pie=get_ware_costs_pie(df_per_ware),
+        profit_histogram=get_profit_per_commander(df_per_subtree),
+        profit_per_sector=get_profit_per_sector(df_per_sector),
+        scatter_margin_profit=get_scatter_margin_profit(df_per_commander),
+        inactive_traders=get_table_inactive_traders_miners(df_inactive_traders),
+        table_per_ship=get_table_per_ship(df_per_ship),
+    )
+
+
+def render_transactions(x4stats, hours=None):
+    df_sales = x4stats.get_df_sales_sorted(hours, filter_zero_value=True)
+    return dict(
+        transactions_per_ship=get_transactions_per_ship(df_sales),
+    )
+
+
+def render_idle(x4stats, hours=None):
+    df_inactive = x4stats.get_inactive_ships(hours)
+    return dict(
+        count=len(df_inactive),
+        inactive_traders=get_table_inactive_traders_miners(df_inactive, height=900),
+    )
+
+
+def render_timeline(x4stats, commander_id=None):
+    data = get_profit_timeline_data(x4stats.get_df_profit_timeline(commander_id))
+    return dict(
+        profit_timeline=get_profit_timeline(data),
+        commander_path=x4stats.get_commander_path(commander_id) if commander_id else [],
+    )
+
+
+def render_timeline_data(x4stats, commander_id=None, start=None, end=None, points=TIMELINE_POINTS):
+    return get_profit_timeline_data(x4stats.get_df_profit_timeline(commander_id), start, end, points)
+
+
+def render_fleet(x4stats, commander_id=None, hours=None):
+    df_per_subtree = x4stats.get_df_per_subtree(hours, commander_id)
+    commander_path = x4stats.get_commander_path(commander_id) if commander_id else []
+
+    title = 'Top level commanders'
+    if commander_path:
+        title = 'Subordinates of ' + str(commander_path[-1][1])
+    return dict(
+        profit_per_subordinate=get_profit_per_commander(df_per_subtree, title=title),
+        subordinates=df_per_subtree.to_dict('records'),
+        commander_path=commander_path,
+    )
+
+
+# Changes of the last loaded saves, the change sets are kept by the process which loads the saves
+def render_changes(x4stats):
+    change_sets = []
+    for change_set in x4stats.get_changes():
+        change_sets.append(dict(
+            game_time=str(round(change_set["game_time"] / 3600, 2)),
+            previous_game_time=str(round(change_set["previous_game_time"] / 3600, 2)),
+            **{k: change_set[k].to_dict('records') for k in ["built", "lost", "reassigned", "orders", "trades"]}
+        ))
+    return dict(
+        change_sets=change_sets,
+    )
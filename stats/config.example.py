@@ -1,3 +1,19 @@
 # SAVE_LOCATION can be a specific file or a directory. When the update button on the dashboard is clicked, the program
 # will check whether a file in the directory is newer than the current file or if the single file has been updated.
 SAVE_LOCATION = r"C:\Users\<your_username>\Documents\Egosoft\X4\<random_number>\save"
+# Number of worker processes rendering the dashboard, only used by the x4stats-server command. 0 is one worker per cpu
+# core. The x4stats command always renders in the web server process itself.
+RENDER_WORKERS = 0
+# Also write the loaded save as memory mapped snapshot in stats/saves for scripts and notebooks, needs pyarrow. Render
+# workers always use a snapshot.
+SNAPSHOT = False
+# Seconds between checks for a new autosave while the live page is open
+LIVE_POLL_SECONDS = 10
+# Maximum number of open live pages. Every live page holds a server thread, x4stats-server adds this many threads to
+# SERVER_THREADS (default 2 per render worker).
+LIVE_MAX_CLIENTS = 4
+# Maximum number of rows and seconds per query of the /api/sql endpoint
+SQL_MAX_ROWS = 10000
+SQL_TIMEOUT_SECONDS = 10
+# Number of rendered pages kept for the loaded save, every page and number of hours is one entry
+HTTP_CACHE_ENTRIES = 64
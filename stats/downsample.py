@@ -0,0 +1,32 @@
+import numpy as np
+
+
+# Largest triangle three buckets: indices of at most threshold points of the series x, y which keep its visual
+# shape. The first and last point are always kept, from every bucket in between the point forming the largest
+# triangle with the previously chosen point and the average of the next bucket.
+def lttb(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    every = (n - 2) / (threshold - 2)
+    indices = np.empty(threshold, dtype=int)
+    indices[0] = 0
+    indices[-1] = n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        if end < next_end:
+            avg_x = x[end:next_end].mean()
+            avg_y = y[end:next_end].mean()
+        else:
+            avg_x = x[n - 1]
+            avg_y = y[n - 1]
+        areas = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(areas))
+        indices[i + 1] = a
+    return indices
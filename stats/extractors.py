@@ -0,0 +1,214 @@
+import xml.etree.ElementTree as ET
+
+
+# Base class for collecting data from a savegame. An extractor lists the element paths it is interested in and gets
+# a start and end call for every matching element. Paths are tag names separated by '/', a '//' matches any number
+# of elements in between, eg: 'savegame/universe//component'.
+class Extractor:
+
+    paths = []
+
+    def start(self, path, elem):
+        pass
+
+    def end(self, path, elem):
+        pass
+
+
+# Node of the path trie. A '//' in a path links a node to a deep node which stays active for all descendants.
+class _Node:
+
+    def __init__(self):
+        self.children = {}
+        self.deep = None
+        self.loop = False
+        self.handlers = []
+
+    def closure(self):
+        nodes = [self]
+        while nodes[-1].deep is not None:
+            nodes.append(nodes[-1].deep)
+        return nodes
+
+
+# Set of trie nodes matching the current element. States are created on first use and cache their transition per
+# tag, so after warming up moving to a child element is a single dict lookup.
+class _State:
+
+    def __init__(self, matcher, nodes):
+        self.matcher = matcher
+        self.nodes = nodes
+        self.handlers = [h for node in nodes for h in node.handlers]
+        self.transitions = {}
+
+    def child(self, tag):
+        state = self.transitions.get(tag)
+        if state is None:
+            nodes = []
+            for node in self.nodes:
+                if tag in node.children:
+                    nodes.extend(node.children[tag].closure())
+                if node.loop:
+                    nodes.append(node)
+            state = self.transitions[tag] = self.matcher.state(nodes)
+        return state
+
+
+class _Matcher:
+
+    def __init__(self, extractors):
+        root = _Node()
+        for extractor in extractors:
+            for path in extractor.paths:
+                node = root
+                for part in path.split('/'):
+                    if part == '':
+                        # '//': the next tag can be at any depth below node
+                        if node.deep is None:
+                            node.deep = _Node()
+                            node.deep.loop = True
+                        node = node.deep
+                        continue
+                    node = node.children.setdefault(part, _Node())
+                node.handlers.append((extractor, path))
+        self.states = {}
+        self.root = self.state(root.closure())
+
+    def state(self, nodes):
+        # same nodes in a stable order, so every combination of nodes has one state
+        nodes = tuple(sorted(set(nodes), key=id))
+        if nodes not in self.states:
+            self.states[nodes] = _State(self, nodes)
+        return self.states[nodes]
+
+
+# Parse a savegame once and call every extractor for the elements on its paths. The cost per element is a dict
+# lookup, independent of the number of extractors.
+def extract(f, extractors):
+    stack = [_Matcher(extractors).root]
+    for event, elem in ET.iterparse(f, events=('start', 'end')):
+        if event == 'start':
+            state = stack[-1].child(elem.tag)
+            stack.append(state)
+            for extractor, path in state.handlers:
+                extractor.start(path, elem)
+        else:
+            state = stack.pop()
+            for extractor, path in state.handlers:
+                extractor.end(path, elem)
+            # clear elem from memory
+            elem.clear()
+
+
+class GameExtractor(Extractor):
+
+    paths = ['savegame/info/game']
+
+    def __init__(self):
+        self.game_time = None
+
+    def start(self, path, elem):
+        self.game_time = float(elem.attrib['time'])
+
+
+# Trades and money transfers from the economy log
+class EconomyLogExtractor(Extractor):
+
+    paths = ['savegame/economylog/entries', 'savegame/economylog/entries/log']
+
+    def __init__(self, transfers=True):
+        self.trades = []
+        self.transfers = []
+        self.include_transfers = transfers
+        # Type of entry
+        self.entries_type = None
+        self.entries_condensed = False
+
+    def start(self, path, elem):
+        if path == 'savegame/economylog/entries':
+            self.entries_type = elem.attrib['type']
+            # check for condensed money log
+            if 'condensed' in elem.attrib and elem.attrib['condensed'] == 1:
+                self.entries_condensed = True
+            else:
+                self.entries_condensed = False
+        # get trades
+        elif self.entries_type == 'trade':
+            self.trades.append(elem.attrib)
+        # Get money transfers, only include uncondensed transfers
+        elif self.entries_type == 'money' and self.include_transfers and not self.entries_condensed:
+            self.transfers.append(elem.attrib)
+
+
+# Player ships and stations with their commander/subordinate connections, default orders and the cluster, sector and
+# zone they are in
+class AssetExtractor(Extractor):
+
+    paths = [
+        'savegame/universe/component/connections//component',
+        'savegame/universe/component/connections//connection',
+        'savegame/universe/component/connections//connected',
+        'savegame/universe/component/connections//order',
+    ]
+    connection_types = ['subordinates', 'commander']
+    location_classes = ['cluster', 'sector', 'zone']
+
+    def __init__(self):
+        self.assets = []
+        self.connections = []
+        self.default_orders = []
+        # asset id -> {cluster, sector, zone} macros of the enclosing components
+        self.locations = {}
+        self.cur_location = {c: None for c in self.location_classes}
+        self.cur_player_entity = None
+        self.cur_connection_type = None
+        self.cur_connection_id = None
+
+    def start(self, path, elem):
+        tag = elem.tag
+        # get player asset info
+        if tag == 'component':
+            # assets are nested in their zone, sector and cluster
+            if elem.attrib.get('class') in self.location_classes:
+                self.cur_location[elem.attrib['class']] = elem.attrib.get('macro')
+            elif 'owner' in elem.attrib and elem.attrib['owner'] == 'player':
+                # store id for commander/subordinate connections
+                self.cur_player_entity = elem.attrib['id']
+                self.assets.append(elem.attrib)
+                self.locations[elem.attrib['id']] = dict(self.cur_location)
+        elif not self.cur_player_entity:
+            pass
+        # check for subordinates and commander connections
+        elif tag == 'connection':
+            if elem.attrib['connection'] in self.connection_types:
+                self.cur_connection_type = elem.attrib['connection']
+                self.cur_connection_id = elem.attrib['id']
+        elif tag == 'connected':
+            if self.cur_connection_type in self.connection_types:
+                self.connections.append({
+                    "player_entity": self.cur_player_entity,
+                    "connection_type": self.cur_connection_type,
+                    "connection_id": self.cur_connection_id,
+                    "connection": elem.attrib['connection']
+                })
+        # Get default order
+        elif tag == 'order':
+            if 'default' in elem.attrib and 'order' in elem.attrib:
+                self.default_orders.append({
+                    'player_entity': self.cur_player_entity,
+                    'order': elem.attrib['order']
+                })
+
+    def end(self, path, elem):
+        # remove current player ship entry
+        if elem.tag == 'component':
+            if elem.attrib.get('class') in self.location_classes:
+                self.cur_location[elem.attrib['class']] = None
+            elif 'owner' in elem.attrib and elem.attrib['owner'] == 'player':
+                self.cur_player_entity = None
+        # Remove connection type subordinates
+        elif (self.cur_player_entity
+              and elem.tag == 'connection'
+              and elem.attrib['connection'] in self.connection_types):
+            self.cur_connection_type = None
+            self.cur_connection_id = None
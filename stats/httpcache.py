@@ -0,0 +1,96 @@
+import functools
+import gzip
+import threading
+from collections import OrderedDict
+
+from flask import make_response
+from flask import request
+from flask import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Responses of pages which only change with token, eg the version token of the loaded save. The body of every url is
+# rendered and compressed once per token. The token is the ETag, so a browser which already has the page gets a 304
+# without anything being rendered.
+class ResponseCache:
+
+    def __init__(self, token, max_entries=64, cache_control='no-cache'):
+        # function returning the current token
+        self.token = token
+        self.max_entries = max_entries
+        self.cache_control = cache_control
+        # (token, url) -> {content_type, encoding -> body}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    # View decorator
+    def cached(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            token = self.token()
+            encoding = self.__accepted_encoding()
+            # strong etags differ per content encoding
+            etag = token + ('-' + encoding if encoding else '')
+            if request.if_none_match.contains(etag):
+                return self.__response(Response(status=304), etag, '')
+
+            key = (token, request.full_path)
+            entry = self.__get(key)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = {"content_type": response.content_type, "": response.get_data()}
+                # token changed while rendering, eg a new save loaded. The next request renders again.
+                if token == self.token():
+                    self.__put(key, entry)
+            body = entry.get(encoding)
+            if body is None:
+                body = entry[encoding] = self.__compress(entry[""], encoding)
+            return self.__response(Response(body, content_type=entry["content_type"]), etag, encoding)
+
+        return wrapper
+
+    def __get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def __put(self, key, entry):
+        with self.lock:
+            # bodies of earlier saves are never served again
+            for k in [k for k in self.entries if k[0] != key[0]]:
+                del self.entries[k]
+            self.entries[key] = entry
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    @staticmethod
+    def __accepted_encoding():
+        if brotli is not None and request.accept_encodings['br']:
+            return 'br'
+        if request.accept_encodings['gzip']:
+            return 'gzip'
+        return ''
+
+    @staticmethod
+    def __compress(body, encoding):
+        if encoding == 'br':
+            return brotli.compress(body, quality=9)
+        if encoding == 'gzip':
+            return gzip.compress(body, compresslevel=9, mtime=0)
+        return body
+
+    def __response(self, response, etag, encoding):
+        response.set_etag(etag)
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = self.cache_control
+        return response
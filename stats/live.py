@@ -0,0 +1,85 @@
+import json
+import threading
+import time
+from collections import deque
+
+
+# Live mode: a background thread watches the save location for autosaves, reads only the new trades from their
+# economylog and publishes them to every connected browser as server sent events. The thread stops when no browser
+# is connected, after which Update save loads the last autosave fully.
+class LiveFeed:
+
+    def __init__(self, x4stats, poll_seconds=10, keep=100, max_listeners=4):
+        self.x4stats = x4stats
+        self.poll_seconds = poll_seconds
+        # every connected browser holds a server thread, see connect
+        self.max_listeners = max_listeners
+        self.thread = None
+        self.condition = threading.Condition()
+        # (sequence number, event data) of the last published batches
+        self.batches = deque(maxlen=keep)
+        self.sequence = 0
+        # number of connected browsers
+        self.listeners = 0
+
+    def start(self):
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.__watch, name='x4stats-live', daemon=True)
+                self.thread.start()
+
+    def __watch(self):
+        while True:
+            try:
+                df_new = self.x4stats.check_for_new_file(economylog_only=True)
+                if df_new is not None:
+                    self.publish(df_new)
+            except Exception as e:
+                print(" * Live update failed: " + str(e))
+            time.sleep(self.poll_seconds)
+            # the live page connects within a poll after start
+            with self.condition:
+                if self.listeners == 0:
+                    self.thread = None
+                    return
+
+    def publish(self, df_new):
+        cols = ["time", "ship_id", "ship_name", "ship_code", "commander_id", "commander_name", "ware", "value",
+                "volume"]
+        data = json.dumps({
+            "game_time": self.x4stats.get_game_time(),
+            "trades": json.loads(df_new[cols].to_json(orient='records')),
+        })
+        with self.condition:
+            self.sequence = self.sequence + 1
+            self.batches.append((self.sequence, data))
+            self.condition.notify_all()
+
+    # Reserve one of the max_listeners connections, returns False when all are in use. Call disconnect when the
+    # event stream is closed.
+    def connect(self):
+        with self.condition:
+            if self.listeners >= self.max_listeners:
+                return False
+            self.listeners = self.listeners + 1
+            return True
+
+    def disconnect(self):
+        with self.condition:
+            self.listeners = self.listeners - 1
+
+    # Generator of server sent event messages for one client. Only batches published after the client connected are
+    # sent, comments keep the connection open in between. A closed browser is noticed with the second write after it
+    # closed, so the keepalive is short.
+    def listen(self, keepalive_seconds=5):
+        with self.condition:
+            sequence = self.sequence
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.sequence > sequence, timeout=keepalive_seconds)
+                batches = [b for b in self.batches if b[0] > sequence]
+                sequence = self.sequence
+            if not batches:
+                yield ': keepalive\n\n'
+            for seq, data in batches:
+                yield 'id: ' + str(seq) + '\ndata: ' + data + '\n\n'
@@ -0,0 +1,55 @@
+import argparse
+import itertools
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def fetch(url):
+    with urllib.request.urlopen(url) as r:
+        return len(r.read())
+
+
+_request_ids = itertools.count()
+
+
+# A unique query parameter makes the server render the page instead of serving it from its response cache
+def uncached(url):
+    return url + ('&' if '?' in url else '?') + 'nocache=' + str(next(_request_ids))
+
+
+def run(urls, concurrency, requests, cache=True):
+    urls = [urls[i % len(urls)] for i in range(requests)]
+    if not cache:
+        urls = [uncached(url) for url in urls]
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        size = sum(executor.map(fetch, urls))
+    return time.time() - start, size
+
+
+# Measure dashboard throughput for an increasing number of concurrent clients, eg:
+# python -m stats.loadtest --concurrency 1 2 4 8 --requests 32
+# Rendered pages show the scaling of the render workers, cached pages the cost of a page which did not change.
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent request throughput of a running x4stats server')
+    parser.add_argument('--url', default='http://127.0.0.1:2992')
+    parser.add_argument('--paths', nargs='+', default=['/stats', '/stats/10', '/transactions/5', '/fleet'])
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8])
+    parser.add_argument('--requests', type=int, default=32)
+    args = parser.parse_args()
+
+    urls = [args.url.rstrip('/') + path for path in args.paths]
+    # warm up workers and caches
+    run(urls, 1, len(urls))
+
+    print('clients  requests  rendered/s  MB/s  cached/s  MB/s')
+    for concurrency in args.concurrency:
+        seconds, size = run(urls, concurrency, args.requests, cache=False)
+        cached_seconds, cached_size = run(urls, concurrency, args.requests)
+        print(f'{concurrency:7}  {args.requests:8}  {args.requests / seconds:10.2f}  {size / seconds / 1e6:4.1f}  '
+              f'{args.requests / cached_seconds:8.2f}  {cached_size / cached_seconds / 1e6:4.1f}')
+
+
+if __name__ == '__main__':
+    main()
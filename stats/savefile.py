@@ -0,0 +1,116 @@
+import io
+import zlib
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class _Inflater:
+
+    def __init__(self, f):
+        self.f = f
+        self.decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.pending = b''
+        self.eof = False
+
+    # Inflate the next chunk into pending, returns False at the end of the file
+    def fill(self):
+        if self.eof:
+            return False
+        data = self.f.read(CHUNK_SIZE)
+        if not data:
+            self.eof = True
+            return False
+        self.pending = self.pending + self.decompressor.decompress(data)
+        if self.decompressor.eof:
+            self.eof = True
+        return True
+
+    def consume(self, n):
+        data = self.pending[:n]
+        self.pending = self.pending[n:]
+        return data
+
+    # Skip the uncompressed data up to marker, returns False when the marker is not found
+    def skip_to(self, marker):
+        while True:
+            i = self.pending.find(marker)
+            if i >= 0:
+                self.consume(i)
+                return True
+            self.consume(max(0, len(self.pending) - len(marker) + 1))
+            if not self.fill():
+                return False
+
+    # Skip the uncompressed data up to the start tag of element name, returns False when there is none. Tags which
+    # only start with name, eg <namex>, are skipped as well.
+    def skip_to_tag(self, name):
+        marker = b'<' + name
+        while self.skip_to(marker):
+            while len(self.pending) <= len(marker) and self.fill():
+                pass
+            if self.pending[len(marker):len(marker) + 1] in (b'>', b'/', b' ', b'\t', b'\r', b'\n'):
+                return True
+            self.consume(len(marker))
+        return False
+
+    # Uncompressed data up to and including marker
+    def read_through(self, marker):
+        while True:
+            i = self.pending.find(marker)
+            if i >= 0:
+                yield self.consume(i + len(marker))
+                return
+            yield self.consume(max(0, len(self.pending) - len(marker) + 1))
+            if not self.fill():
+                yield self.consume(len(self.pending))
+                return
+
+
+# Binary file object reading from a generator of byte strings
+class _IterReader(io.RawIOBase):
+
+    def __init__(self, chunks, close):
+        self.chunks = chunks
+        self.rest = memoryview(b'')
+        self.close_file = close
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self.rest:
+            chunk = next(self.chunks, None)
+            if chunk is None:
+                return 0
+            self.rest = memoryview(chunk)
+        n = min(len(b), len(self.rest))
+        b[:n] = self.rest[:n]
+        self.rest = self.rest[n:]
+        return n
+
+    def close(self):
+        self.close_file()
+        super().close()
+
+
+# Open only the given top level sections of a compressed save, as an xml document <savegame>sections</savegame>.
+# Sections must be given in file order. The data in between is still inflated, but skipped by a byte scan without
+# xml parsing, and reading stops at the end of the last section.
+def open_sections(save, sections):
+    f = open(save, 'rb')
+    inflater = _Inflater(f)
+
+    def chunks():
+        yield b'<savegame>'
+        for section in sections:
+            name = section.encode()
+            if not inflater.skip_to_tag(name):
+                break
+            start_tag = b''.join(inflater.read_through(b'>'))
+            yield start_tag
+            # an empty section <name/> has no end tag
+            if not start_tag.endswith(b'/>'):
+                yield from inflater.read_through(b'</' + name + b'>')
+        yield b'</savegame>'
+
+    return io.BufferedReader(_IterReader(chunks(), f.close), CHUNK_SIZE)
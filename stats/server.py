@@ -0,0 +1,31 @@
+import os
+
+
+# Production server. The app is imported here and not at module level: the render workers import the main module
+# when they start and must not load the save themselves.
+# Other WSGI servers can serve stats.app:app directly, eg: waitress-serve --port=2992 stats.app:app
+def main():
+    try:
+        from waitress import serve
+    except ImportError:
+        print("waitress is not installed. Install the server extras with: pip install -e .[server]")
+        quit()
+    from stats.app import app, render_pool, live_feed
+
+    render_pool.workers = app.config.get("RENDER_WORKERS", 0) or os.cpu_count() or 1
+    # start the workers before the first request comes in
+    render_pool.get_executor()
+    try:
+        serve(
+            app,
+            host=app.config.get("SERVER_HOST", "127.0.0.1"),
+            port=app.config.get("SERVER_PORT", 2992),
+            # live pages keep their thread, they get threads of their own next to those for the other pages
+            threads=app.config.get("SERVER_THREADS", 2 * render_pool.workers) + live_feed.max_listeners,
+        )
+    finally:
+        render_pool.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import math
+import sqlite3
+import threading
+import time
+
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+
+
+class SqlError(Exception):
+    pass
+
+
+# Read only sql over the loaded data. The tables are sales (see X4stats.get_df_sales), assets (X4stats.fleet) and
+# activity (X4stats.activity). DuckDB queries the pandas frames in place. Without duckdb the tables are copied once
+# per loaded save into an in-memory sqlite database.
+class SqlEngine:
+
+    def __init__(self, x4stats, max_rows=10000, timeout=10):
+        self.x4stats = x4stats
+        self.max_rows = max_rows
+        self.timeout = timeout
+        self.engine = 'duckdb' if duckdb is not None else 'sqlite'
+        self.sqlite = None
+        self.sqlite_version = None
+        self.lock = threading.Lock()
+
+    def tables(self):
+        data = self.x4stats.data
+        return {
+            "sales": data.sales,
+            "assets": data.fleet.reset_index(),
+            "activity": data.activity.reset_index(),
+        }
+
+    # Returns a dict with columns, rows and whether the rows were truncated at max_rows
+    def query(self, sql, max_rows=None):
+        if max_rows is not None and max_rows < 1:
+            raise SqlError('The row limit must be at least 1')
+        max_rows = min(max_rows or self.max_rows, self.max_rows)
+        if self.engine == 'duckdb':
+            columns, rows = self.__query_duckdb(sql, max_rows)
+        else:
+            columns, rows = self.__query_sqlite(sql, max_rows)
+        return {
+            "engine": self.engine,
+            "columns": columns,
+            "rows": [[_json_value(v) for v in row] for row in rows[:max_rows]],
+            "truncated": len(rows) > max_rows,
+        }
+
+    def __query_duckdb(self, sql, max_rows):
+        # a connection per query: registering the frames does not copy them and connections are not thread safe
+        con = duckdb.connect(config={'enable_external_access': False})
+        try:
+            for name, df in self.tables().items():
+                con.register(name, df)
+            con.execute("SET lock_configuration = true")
+            try:
+                statements = con.extract_statements(sql)
+            except duckdb.Error as e:
+                raise SqlError(str(e))
+            if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+                raise SqlError('Only a single SELECT statement is allowed')
+
+            timer = threading.Timer(self.timeout, con.interrupt)
+            timer.start()
+            try:
+                cursor = con.execute(sql)
+                rows = cursor.fetchmany(max_rows + 1)
+            except duckdb.InterruptException:
+                raise SqlError('Query exceeded the timeout of ' + str(self.timeout) + ' seconds')
+            except duckdb.Error as e:
+                raise SqlError(str(e))
+            finally:
+                timer.cancel()
+            return [d[0] for d in cursor.description], rows
+        finally:
+            con.close()
+
+    def __query_sqlite(self, sql, max_rows):
+        with self.lock:
+            con = self.__get_sqlite()
+            deadline = time.time() + self.timeout
+            # a non zero return value aborts the query
+            con.set_progress_handler(lambda: int(time.time() > deadline), 10000)
+            try:
+                cursor = con.execute(sql)
+                rows = cursor.fetchmany(max_rows + 1)
+            except sqlite3.OperationalError as e:
+                if time.time() > deadline:
+                    raise SqlError('Query exceeded the timeout of ' + str(self.timeout) + ' seconds')
+                raise SqlError(str(e))
+            except (sqlite3.Error, sqlite3.Warning) as e:
+                raise SqlError(str(e))
+            finally:
+                con.set_progress_handler(None, 0)
+            return [d[0] for d in cursor.description or []], rows
+
+    def __get_sqlite(self):
+        if self.sqlite is None or self.sqlite_version != self.x4stats.version:
+            con = sqlite3.connect(':memory:', check_same_thread=False)
+            for name, df in self.tables().items():
+                df.to_sql(name, con, index=False)
+            con.set_authorizer(_sqlite_read_only)
+            self.sqlite = con
+            self.sqlite_version = self.x4stats.version
+        return self.sqlite
+
+
+# Value as json type. NaN and infinity are null, types json has no counterpart for (dates, intervals, decimals, blobs,
+# uuids) are strings.
+def _json_value(v):
+    if v is None or isinstance(v, (bool, int, str)):
+        return v
+    if isinstance(v, float):
+        return v if math.isfinite(v) else None
+    if isinstance(v, (list, tuple)):
+        return [_json_value(x) for x in v]
+    if isinstance(v, dict):
+        return {str(k): _json_value(x) for k, x in v.items()}
+    if isinstance(v, (bytes, bytearray, memoryview)):
+        return bytes(v).hex()
+    if hasattr(v, 'isoformat'):
+        return v.isoformat()
+    return str(v)
+
+
+def _sqlite_read_only(action, arg1, arg2, db_name, trigger):
+    if action in (sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE):
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
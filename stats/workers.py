@@ -0,0 +1,61 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from stats.x4stats import X4stats
+
+# Dataset of the current worker process, set once when the worker starts
+_x4stats = None
+
+
+def _init_worker(x4stats, snapshot=None):
+    global _x4stats
+    if snapshot:
+        x4stats = X4stats(snapshot=snapshot)
+    _x4stats = x4stats
+
+
+def _call(func, *args):
+    return func(_x4stats, *args)
+
+
+# Runs chart rendering and aggregation in a pool of worker processes so that requests from several browser tabs are
+# not serialized by the GIL. Every worker attaches to the memory mapped snapshot of the loaded dataset, or receives a
+# copy of the dataset when pyarrow is not installed. Snapshots are only written once the first pool starts. When the dataset is reloaded the pool is replaced by a new one
+# holding the new data. With 0 workers everything runs in the calling process.
+class RenderPool:
+
+    def __init__(self, x4stats, workers=0):
+        self.x4stats = x4stats
+        self.workers = workers
+        self.executor = None
+        self.version = None
+        self.lock = threading.Lock()
+
+    def run(self, func, *args):
+        if not self.workers:
+            return func(self.x4stats, *args)
+        return self.get_executor().submit(_call, func, *args).result()
+
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None or self.version != self.x4stats.version:
+                if self.executor is not None:
+                    # running renders finish on the old data
+                    self.executor.shutdown(wait=False)
+                # workers attach to the snapshot instead of receiving a copy of the dataset
+                self.x4stats.enable_snapshots()
+                self.version = self.x4stats.version
+                self.executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(None, self.x4stats.snapshot) if self.x4stats.snapshot else (self.x4stats,),
+                )
+                print(" * Started", self.workers, "render workers")
+            return self.executor
+
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
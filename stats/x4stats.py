@@ -1,6 +1,8 @@
 import datetime
-import xml.etree.ElementTree as ET
 import gzip
+from stats import savefile
+from stats.extractors import extract, GameExtractor, EconomyLogExtractor, AssetExtractor
+from stats import changes
 import pandas as pd
 import numpy as np
 import math
@@ -8,28 +10,121 @@ from pathlib import Path
 import os
 import time
 import shutil
+import threading
+import atexit
+import ctypes
 from stats.constants import ECO_ORDERS, SHIP_CLASSES, STATION_CLASSES, PLAYER_CLASSES, ALL_CLASSES, LOAD_MESSAGES
 import random
 
+try:
+    import pyarrow as pa
+except ImportError:
+    pa = None
+
+# Number of change sets kept, see get_changes
+CHANGES_KEEP = 20
+
+# Snapshots are written here as snapshot_<pid>_<version>, see enable_snapshots
+SNAPSHOT_DIR = Path('stats/saves')
+
+# Only one save is loaded at a time, also when the live mode and the update button trigger a load simultaneously
+_load_lock = threading.Lock()
+
+
+def _pid_running(pid):
+    if os.name == 'nt':
+        # os.kill would terminate the process on windows
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+# The data of a loaded save read by the pages. A load builds a new SaveData and publishes it with a single assignment
+# to X4stats.data, readers take that reference once per call so they never mix the data of two saves.
+class SaveData:
+
+    def __init__(self, game_time=None, sales=None, fleet=None, sales_hours=None, sales_nonzero=None, activity=None,
+                 sector_index=None):
+        self.game_time = game_time
+        # sorted by time
+        self.sales = sales
+        self.fleet = fleet
+        # lookup arrays for get_df_sales: negated hours since event and the rows with trade value
+        self.sales_hours = sales_hours
+        self.sales_nonzero = sales_nonzero
+        self.activity = activity
+        self.sector_index = sector_index
+
 
 class X4stats:
 
-    def __init__(self, save_location):
+    def __init__(self, save_location=None, snapshot=None):
 
         self.is_ready = False
         self.xmltree = None
-        self.game_time = None
+        self.data = SaveData()
         self.own_ships = None
         self.own_ship_ids = None
         self.player_id = None
-        self.sales = None
+        # ships and stations no longer in the save, kept with their trades: id -> asset info
+        self.lost_ships = {}
+        # changes per loaded save, newest first
+        self.changes = []
         self.save_location = save_location
+        # mtime of the last read save and of the last fully loaded save, live mode reads only the trades of a save
         self.save_mtime = None
-        self.check_for_new_file()
+        self.full_save_mtime = None
+        # increased with every loaded save
+        self.version = 0
+        # unique per loaded save, also over restarts. Used as etag of the pages.
+        self.started = '%x' % time.time_ns()
+        self.version_token = self.started + '-0'
+        # path of the current snapshot, written for every loaded save once snapshots are enabled
+        self.snapshot = None
+        self.snapshots = False
+        if snapshot:
+            self.attach_snapshot(snapshot)
+        else:
+            self.check_for_new_file()
         pd.set_option('display.max_rows', None)
         # print(self.player_id)
 
-    def check_for_new_file(self):
+    # Fields of the current SaveData. Code reading more than one of them takes self.data once instead.
+    @property
+    def game_time(self):
+        return self.data.game_time
+
+    @property
+    def sales(self):
+        return self.data.sales
+
+    @property
+    def fleet(self):
+        return self.data.fleet
+
+    @property
+    def activity(self):
+        return self.data.activity
+
+    # Load the newest save when it changed. With economylog_only only trades newer than the loaded save are read, the
+    # new sales rows are returned. Without, a save of which live mode only read the trades is loaded fully.
+    def check_for_new_file(self, economylog_only=False):
+        with _load_lock:
+            return self.__check_for_new_file(economylog_only)
+
+    def __check_for_new_file(self, economylog_only=False):
         # dir of file
         p = Path(self.save_location)
         if p.is_dir():
@@ -42,9 +137,11 @@ class X4stats:
                     p = paths[i]
                 i = i + 1
 
+        economylog_only = economylog_only and self.own_ships is not None
+        loaded_mtime = self.save_mtime if economylog_only else self.full_save_mtime
         mtime = os.path.getmtime(p)
         # (New) file found. Give is 10 seconds to write
-        if not self.save_mtime or (self.save_mtime < mtime and (time.time() - mtime) > 10):
+        if not loaded_mtime or (loaded_mtime < mtime and (time.time() - mtime) > 10):
             self.save_mtime = mtime
             # copy to minimize interruption for the game
             p_to = Path('stats/saves/savegame_wrk.gz')
@@ -54,100 +151,30 @@ class X4stats:
             except shutil.SameFileError:
                 pass
             # trigger reload
+            if economylog_only:
+                print(" * New economylog loading: " + str(p))
+                return self.reload_economylog(p_to)
+            self.full_save_mtime = mtime
             print(" * New save loading: " + str(p))
             self.reload(p_to)
+        return None
 
     # (re)load save file
     def reload(self, save):
 
         process_start_time = datetime.datetime.now()
+        previous = self.__fleet_state()
+        previous_ships = self.own_ships or []
+        previous_player_id = self.player_id
 
-        assets = []
-        trades = []
-        transfers = []
-        default_orders = []
-        # Type of entry
-        entries_type = None
-        entries_condensed = False
-        connections = []
-        cur_player_entity = None
-        cur_connection_type = None
-        cur_connection_id = None
-        connection_types = ['subordinates', 'commander']
+        game = GameExtractor()
+        economylog = EconomyLogExtractor()
+        assets = AssetExtractor()
 
+        # Collect everything in a single pass over the save
         with gzip.open(save) as f:
-            path = []
-            xml = ET.iterparse(f, events=('start', 'end'))
-
-            # Build path with every start and remove with every end event
-            for event, elem in xml:
-                if event == 'start':
-                    path.append(elem.tag)
-                    # Get game start time
-                    if path == ['savegame', 'info', 'game']:
-                        self.game_time = float(elem.attrib['time'])
-                    elif path == ['savegame', 'economylog', 'entries']:
-                        entries_type = elem.attrib['type']
-                        # check for condensed money log
-                        if 'condensed' in elem.attrib and elem.attrib['condensed'] == 1:
-                            entries_condensed = True
-                        else:
-                            entries_condensed = False
-                    # get trades
-                    elif path == ['savegame', 'economylog', 'entries', 'log'] and entries_type == 'trade':
-                        trades.append(elem.attrib)
-                    # Get money transfers
-                    elif path == ['savegame', 'economylog', 'entries', 'log'] and entries_type == 'money':
-                        # Only include uncondensed transfers
-                        if not entries_condensed:
-                            transfers.append(elem.attrib)
-                    # get player asset info
-                    elif (path[0:4] == ['savegame', 'universe', 'component', 'connections']
-                            and elem.tag == 'component'
-                            and 'owner' in elem.attrib
-                            and elem.attrib['owner'] == 'player'):
-                        # store id for commander/subordinate connections
-                        cur_player_entity = elem.attrib['id']
-                        assets.append(elem.attrib)
-                    # check for subordinates and commander connections
-                    elif (cur_player_entity
-                          and elem.tag == 'connection'
-                          and elem.attrib['connection'] in connection_types):
-                        cur_connection_type = elem.attrib['connection']
-                        cur_connection_id = elem.attrib['id']
-                    elif cur_player_entity and cur_connection_type in connection_types and elem.tag == 'connected':
-                        connections.append({
-                            "player_entity": cur_player_entity,
-                            "connection_type": cur_connection_type,
-                            "connection_id": cur_connection_id,
-                            "connection": elem.attrib['connection']
-                        })
-                    # Get default order
-                    elif (cur_player_entity
-                          and elem.tag == 'order'
-                          and 'default' in elem.attrib
-                          and 'order' in elem.attrib):
-                        default_orders.append({
-                            'player_entity': cur_player_entity,
-                            'order': elem.attrib['order']
-                        })
-                if event == 'end':
-                    # remove current player ship entry
-                    if (path[0:4] == ['savegame', 'universe', 'component', 'connections']
-                          and elem.tag == 'component'
-                          and 'owner' in elem.attrib
-                          and elem.attrib['owner'] == 'player'):
-                        cur_player_entity = None
-                    # Remove connection type subordinates
-                    elif (cur_player_entity
-                          and elem.tag == 'connection'
-                          and elem.attrib['connection'] in connection_types):
-                        cur_connection_type = None
-                        cur_connection_id = None
-                    # remove last value in path
-                    path.pop()
-                    # clear elem from memory
-                    elem.clear()
+            extract(f, [game, economylog, assets])
+            game_time = game.game_time
 
             process_end_time = datetime.datetime.now()
             process_time = process_end_time - process_start_time
@@ -157,37 +184,298 @@ class X4stats:
 
         # Find all player owned ships and stations
         self.own_ships, self.own_ship_ids, self.player_id = self.__calc_ship_info(
-            assets=assets,
-            connections=connections,
-            orders=default_orders)
+            assets=assets.assets,
+            connections=assets.connections,
+            orders=assets.default_orders,
+            locations=assets.locations)
+        # An older save or another game: the assets of the previous save are not lost and there is nothing to compare
+        if previous is not None and (game_time < previous["game_time"] or self.player_id != previous_player_id):
+            print(" * Older save or other game loaded, lost ships and changes are reset")
+            self.lost_ships = {}
+            self.changes = []
+            previous = None
+            previous_ships = []
+        self.__keep_lost_ships(previous_ships)
+        fleet = self.__calc_fleet_tree(self.own_ships)
         self.print_random_load_msg()
 
         # calculate sales
-        self.sales = self.__calc_sales(
-            trades=trades,
-            transfers=transfers
+        sales = self.__calc_sales(
+            trades=economylog.trades,
+            transfers=economylog.transfers,
+            game_time=game_time
         )
-        print(self.sales)
+        print(sales)
+        self.data = self.__save_data(game_time, sales, fleet)
         self.print_random_load_msg()
 
-        xml = None
+        self.__add_changes(previous)
+        self.__new_version()
 
         print(" * Loading complete")
 
+    # Read only the trades in the economylog of a newer save of the same game and add them to the sales. Ships and
+    # stations are taken from the last full load, trades of assets acquired since then are skipped.
+    def reload_economylog(self, save):
+        process_start_time = datetime.datetime.now()
+        previous = self.__fleet_state()
+
+        data = self.data
+        previous_game_time = data.game_time
+        game_time, trades = self.__read_economylog(save)
+        if game_time < previous_game_time:
+            # eg a loaded older save, its trades can not be added to the newer ones
+            self.full_save_mtime = self.save_mtime
+            self.reload(save)
+            return None
+        new_trades = [t for t in trades if float(t["time"]) > previous_game_time]
+
+        sales_list = self.__calc_trade_sales(new_trades)
+        if sales_list:
+            df_new = self.__sales_df(sales_list, game_time)
+            sales = self.__sort_sales(pd.concat([data.sales, df_new], ignore_index=True), game_time)
+        else:
+            df_new = data.sales.iloc[0:0]
+            sales = self.__sort_sales(data.sales.copy(), game_time)
+        self.data = self.__save_data(game_time, sales, data.fleet)
+        self.__add_changes(previous)
+        self.__new_version()
+
+        process_time = round((datetime.datetime.now() - process_start_time).total_seconds(), 2)
+        print(' * Read', len(new_trades), 'new trades in', str(process_time), 'seconds')
+        return df_new
+
+    # Game time and trade entries of a save. Only the info and economylog sections are passed to the xml parser.
+    @staticmethod
+    def __read_economylog(save):
+        game = GameExtractor()
+        economylog = EconomyLogExtractor(transfers=False)
+        with savefile.open_sections(save, ['info', 'economylog']) as f:
+            extract(f, [game, economylog])
+        return game.game_time, economylog.trades
+
+    def __fleet_state(self):
+        if self.own_ships is None:
+            return None
+        data = self.data
+        return changes.fleet_state(self.own_ships, data.sales, data.game_time)
+
+    # Ships and stations of the previous save which are gone from this one are kept as commanderless assets without
+    # orders, so their trades still count. Only assets seen by this process are known, not those lost before it started.
+    def __keep_lost_ships(self, previous_ships):
+        ids = set(self.own_ship_ids)
+        for ship in previous_ships:
+            if ship["id"] not in ids and ship["class"] not in PLAYER_CLASSES and not ship["lost"]:
+                self.lost_ships[ship["id"]] = dict(
+                    ship,
+                    parent_id=None,
+                    commander_id=ship["id"],
+                    commander_name=ship["name"],
+                    default_order=None,
+                    lost=True,
+                )
+        for ship_id in [i for i in self.lost_ships if i in ids]:
+            del self.lost_ships[ship_id]
+        self.own_ships = self.own_ships + list(self.lost_ships.values())
+        self.own_ship_ids = self.own_ship_ids + list(self.lost_ships)
+
+    def __add_changes(self, previous):
+        if previous is None:
+            return
+        change_set = changes.diff(previous, self.__fleet_state(), self.data.sales)
+        # the version this change set becomes part of
+        change_set["version"] = self.version + 1
+        self.changes = [change_set] + self.changes[:CHANGES_KEEP - 1]
+        print(" * Changes: " + ", ".join(
+            str(len(change_set[k])) + " " + k for k in ["built", "lost", "reassigned", "orders", "trades"]))
+
+    # Change sets of the last loaded saves, newest first. Every change set has the game time of the save and the
+    # previous save and DataFrames built, lost, reassigned, orders and trades.
+    def get_changes(self):
+        return self.changes
+
+    # Mark the loaded data as changed and share it with other processes. Must be the last step of a load: the render
+    # pool restarts on the new version and cached pages are rendered again on the new token.
+    def __new_version(self):
+        version = self.version + 1
+        if self.snapshots:
+            self.__write_version_snapshot(version)
+        self.version = version
+        self.version_token = self.started + '-' + str(version)
+
+    # Write a snapshot of the loaded save and of every save loaded from now on, for render workers and scripts
+    # attaching to stats/saves. The snapshots are removed when the process exits. Returns False without pyarrow.
+    def enable_snapshots(self):
+        if pa is None:
+            return False
+        with _load_lock:
+            if not self.snapshots:
+                self.snapshots = True
+                atexit.register(self.__remove_snapshots)
+                if self.sales is not None:
+                    self.__write_version_snapshot(self.version)
+        return True
+
+    def __write_version_snapshot(self, version):
+        self.snapshot = self.write_snapshot(
+            SNAPSHOT_DIR / ('snapshot_' + str(os.getpid()) + '_' + str(version)), version)
+        self.remove_stale_snapshots()
+
+    # Remove the earlier snapshots of this process and those of processes which are no longer running. Snapshots
+    # still mapped by a worker on windows cannot be removed yet, they are retried with the next snapshot.
+    def remove_stale_snapshots(self):
+        current = Path(self.snapshot).name if self.snapshot else None
+        for p in SNAPSHOT_DIR.glob('snapshot_*.sales.arrow'):
+            name = p.name[:-len('.sales.arrow')]
+            try:
+                pid = int(name.split('_')[1])
+            except (IndexError, ValueError):
+                continue
+            if name != current and (pid == os.getpid() or not _pid_running(pid)):
+                self.remove_snapshot(SNAPSHOT_DIR / name)
+
+    def __remove_snapshots(self):
+        if self.snapshot:
+            self.remove_snapshot(self.snapshot)
+            self.snapshot = None
+
+    # Write the sales and asset tables as arrow ipc files <path>.sales.arrow and <path>.assets.arrow. Other processes
+    # attach to them with attach_snapshot without parsing the save.
+    def write_snapshot(self, path, version=None):
+        data = self.data
+        metadata = {
+            "game_time": str(data.game_time),
+            "player_id": str(self.player_id),
+            "version": str(self.version if version is None else version),
+        }
+        tables = {
+            "sales": data.sales,
+            "assets": data.fleet.reset_index(),
+        }
+        for name, df in tables.items():
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            table = table.replace_schema_metadata({**table.schema.metadata, **metadata})
+            # write to a temporary file first so readers never see a half written snapshot
+            p_tmp = Path(str(path) + '.' + name + '.arrow.tmp')
+            with pa.OSFile(str(p_tmp), 'wb') as sink:
+                with pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            os.replace(p_tmp, str(path) + '.' + name + '.arrow')
+        print(" * Snapshot written: " + str(path))
+        return str(path)
+
+    # Attach to a snapshot written by write_snapshot. The file is memory mapped: numeric columns point straight into
+    # the page cache which is shared by every process attached to the same snapshot. path can also be a directory,
+    # the newest snapshot in it is used.
+    def attach_snapshot(self, path):
+        p = Path(path)
+        if p.is_dir():
+            paths = sorted(p.glob('*.sales.arrow'), key=os.path.getmtime, reverse=True)
+            if not paths:
+                raise FileNotFoundError('No snapshot found in ' + str(p))
+            p = Path(str(paths[0])[:-len('.sales.arrow')])
+
+        tables = {}
+        for name in ["sales", "assets"]:
+            source = pa.memory_map(str(p) + '.' + name + '.arrow', 'r')
+            tables[name] = pa.ipc.open_file(source).read_all()
+
+        metadata = tables["sales"].schema.metadata
+        fleet = tables["assets"].to_pandas(split_blocks=True).set_index("id")
+        self.player_id = metadata[b"player_id"].decode()
+        self.version = int(metadata[b"version"])
+        self.own_ship_ids = list(fleet.index)
+        self.data = self.__save_data(
+            float(metadata[b"game_time"]), tables["sales"].to_pandas(split_blocks=True), fleet)
+        self.snapshot = str(p)
+
+    @staticmethod
+    def remove_snapshot(path):
+        for name in ["sales", "assets"]:
+            try:
+                os.remove(str(path) + '.' + name + '.arrow')
+            except OSError:
+                # still mapped by a process on windows, or already removed
+                pass
+
     def get_game_time(self):
         return self.game_time
 
+    # Sales is sorted by time, so the sales of the last X hours are the tail of the frame. Without zero value filter
+    # the returned frame is a slice of self.sales and must not be modified.
     def get_df_sales(self, hours=None, filter_zero_value=False):
-        df = self.sales.copy()
+        return self.__sales_window(self.data, hours, filter_zero_value)
+
+    @staticmethod
+    def __sales_window(data, hours=None, filter_zero_value=False):
+        start = 0
         if hours:
             # uren beginnen te tellen bij 0. Laatste 1 uur is dus uur <= 0
             hours = int(hours) - 1
-            df = df.query("hours_since_event <= " + str(hours))
+            start = np.searchsorted(data.sales_hours, -hours, side='left')
+        df = data.sales.iloc[start:]
         if filter_zero_value:
-            df = df.query("value != 0")
+            df = df[data.sales_nonzero[start:]]
 
         return df
 
+    # SaveData of sales with its lookup arrays. The negated hours since event are ascending because the sales are
+    # sorted by time.
+    def __save_data(self, game_time, sales, fleet):
+        return SaveData(
+            game_time=game_time,
+            sales=sales,
+            fleet=fleet,
+            sales_hours=-sales["hours_since_event"].to_numpy(),
+            sales_nonzero=sales["value"].to_numpy() != 0,
+            activity=self.__calc_activity(sales),
+            sector_index=self.__calc_sector_index(sales),
+        )
+
+    # Trade totals per sector for every "last X hours" window. Row h of each matrix holds the totals of the sales with
+    # hours_since_event <= h, one column per sector, so a window is a single row lookup instead of a groupby.
+    @staticmethod
+    def __calc_sector_index(df):
+        codes, sectors = pd.factorize(df["sector"].fillna("unknown"))
+        hours = np.clip(df["hours_since_event"].to_numpy(), 0, None)
+        n_hours = int(hours.max()) + 1 if len(hours) else 1
+        n_sectors = len(sectors)
+        cells = hours * n_sectors + codes
+        index = {"sectors": sectors}
+        columns = {
+            "value": df["value"].to_numpy(),
+            "sales": df["sales"].to_numpy(),
+            "costs": df["costs"].to_numpy(),
+            "volume": df["volume"].to_numpy(),
+            "trades": (df["volume"].to_numpy() != 0).astype(float),
+        }
+        for name, weights in columns.items():
+            totals = np.bincount(cells, weights=weights, minlength=n_hours * n_sectors)
+            index[name] = totals.reshape(n_hours, n_sectors).cumsum(axis=0)
+        return index
+
+    # One row per ship and station with the time of its last trade and its number of trades. Account mutations and
+    # the zero value rows of assets without trades have no volume and do not count as trade.
+    # Built from single columns: a mask or column list on the whole frame merges the memory mapped columns of a
+    # snapshot into heap copies.
+    @staticmethod
+    def __calc_activity(df):
+        is_trade = df["volume"].to_numpy() != 0
+        df_trades = pd.DataFrame({
+            "ship_id": df["ship_id"].to_numpy()[is_trade],
+            "time": df["time"].to_numpy()[is_trade],
+        })
+        is_last = ~df["ship_id"].duplicated(keep="last").to_numpy()
+        df_activity = pd.DataFrame({
+            col: df[col].to_numpy()[is_last]
+            for col in ["ship_id", "ship_class", "commander_name", "default_order", "ship_code", "ship_name", "ship_type"]
+        }).set_index("ship_id")
+        df_per_ship = df_trades.groupby("ship_id")["time"].agg(["min", "max", "count"])
+        df_per_ship.columns = ["first_trade_time", "last_trade_time", "trades"]
+        df_activity = df_activity.join(df_per_ship)
+        df_activity["trades"] = df_activity["trades"].fillna(0).astype(int)
+        return df_activity
+
     def get_df_sales_sorted(self, hours=None, filter_zero_value=False):
         df = self.get_df_sales(hours, filter_zero_value)
         df = df.sort_values(["ship_name", "time"])
@@ -198,7 +486,7 @@ class X4stats:
 
     def __calc_df_per_ship(self, hours=None):
         df = self.get_df_sales(hours)
-        df_per_ship = df.drop(["time", "ware", "hours_since_event"], axis=1) \
+        df_per_ship = df.drop(["time", "ware", "hours_since_event", "commander_id", "tree_index", "sector"], axis=1) \
             .groupby(["ship_id", "ship_class", "commander_name", "default_order", "ship_code", "ship_name", "ship_type"]
                      , dropna=False).sum().reset_index()
         # print(df_per_ship.head())
@@ -210,32 +498,134 @@ class X4stats:
 
         return df_per_ship
 
-    # geen trade waarde in de laatste X uren, maar wel trade orders
-    def get_idle_traders_miners(self, hours):
-        df = self.__calc_df_per_ship(hours)
-        return df.loc[
-            (df['default_order'].isin(ECO_ORDERS))
-            & (df['ship_class'].isin(SHIP_CLASSES))
-            & (df['value'] == 0)
-        ]
-
-    # df['ship_class'].isin(SHIP_CLASSES), df['value'] == 0
-
     def get_df_per_commander(self, hours=None):
         return self.__calc_df_per_commander(hours)
 
     def __calc_df_per_commander(self, hours=None):
         df = self.get_df_sales(hours)
-        df_per_com = df.drop(["time", "ware", "hours_since_event"], axis=1) \
-            .groupby(["commander_name"]
+        # groeperen op id, stations of schepen met dezelfde naam mogen niet samenvallen
+        df_per_com = df[["commander_id", "commander_name", "value", "sales", "costs", "volume"]] \
+            .groupby(["commander_id", "commander_name"]
                      , dropna=False).sum().reset_index()
         # print(df_per_com.head())
 
-        df_per_com.columns = ["commander_name", "value", "sales", "costs", "volume"]
+        df_per_com.columns = ["commander_id", "commander_name", "value", "sales", "costs", "volume"]
         df_per_com = self.__per_x_help(df_per_com)
         # print(df_per_com)
         return df_per_com
 
+    # Trade value per sector the assets are in. Ships are counted in their sector at the time of the save, not where
+    # the trade took place.
+    def get_df_per_sector(self, hours=None):
+        return self.__calc_df_per_sector(hours)
+
+    def __calc_df_per_sector(self, hours=None):
+        index = self.data.sector_index
+        n_hours = index["value"].shape[0]
+        row = n_hours - 1
+        if hours:
+            row = min(int(hours) - 1, n_hours - 1)
+
+        df_per_sector = pd.DataFrame({"sector": index["sectors"]})
+        for col in ["value", "sales", "costs", "volume", "trades"]:
+            if row < 0:
+                df_per_sector[col] = 0.0
+            else:
+                df_per_sector[col] = index[col][row]
+        df_per_sector["trades"] = df_per_sector["trades"].astype(int)
+        df_per_sector = self.__per_x_help(df_per_sector)
+        return df_per_sector.sort_values("value", ascending=False).reset_index(drop=True)
+
+    def get_df_per_ware(self, hours=None):
+        return self.__calc_df_per_ware(hours)
+
+    def __calc_df_per_ware(self, hours=None):
+        df = self.get_df_sales(hours, filter_zero_value=True)
+        df_per_ware = df[["ware", "value", "sales", "costs", "volume"]] \
+            .groupby(["ware"]).sum().reset_index()
+        return df_per_ware
+
+    # Trade value of every direct subordinate of commander_id (or of the top level commanders when no id is given)
+    # including everything below them in the command hierarchy.
+    def get_df_per_subtree(self, hours=None, commander_id=None):
+        return self.__calc_df_per_subtree(self.data, hours, commander_id)
+
+    def __calc_df_per_subtree(self, data, hours=None, commander_id=None):
+        df = self.__sales_window(data, hours)
+        fleet = data.fleet
+        if commander_id:
+            df_nodes = fleet.loc[fleet["parent_id"] == commander_id]
+        else:
+            df_nodes = fleet.loc[fleet["parent_id"].isna()]
+
+        # Sales per tree position, every subtree is a contiguous range [tin, tout) in the euler tour.
+        # A subtree total is the difference of two prefix sums instead of a walk over all subordinates.
+        tin = df_nodes["tin"].to_numpy()
+        tout = df_nodes["tout"].to_numpy()
+        df_per_sub = pd.DataFrame({
+            "commander_id": df_nodes.index,
+            "commander_name": df_nodes["name"].to_numpy(),
+            "ship_code": df_nodes["code"].to_numpy(),
+            "ship_class": df_nodes["class"].to_numpy(),
+            "depth": df_nodes["depth"].to_numpy(),
+            "subordinates": tout - tin - 1,
+        })
+        for col in ["value", "sales", "costs", "volume"]:
+            per_node = np.bincount(df["tree_index"], weights=df[col], minlength=len(fleet))
+            prefix = np.concatenate(([0], np.cumsum(per_node)))
+            df_per_sub[col] = prefix[tout] - prefix[tin]
+
+        df_per_sub = self.__per_x_help(df_per_sub)
+        return df_per_sub.sort_values("value", ascending=False).reset_index(drop=True)
+
+    # Trade value per game hour over the whole game for commander_id (or all assets) including subordinates and for its
+    # n direct subordinates (or top level commanders) with the highest value. One row per series and hour.
+    def get_df_profit_timeline(self, commander_id=None, n=10):
+        return self.__calc_df_profit_timeline(self.data, commander_id, n)
+
+    def __calc_df_profit_timeline(self, data, commander_id=None, n=10):
+        df = self.__sales_window(data, filter_zero_value=True)
+        fleet = data.fleet
+        if commander_id:
+            node = fleet.loc[commander_id]
+            series = [(commander_id, node["name"], node["tin"], node["tout"])]
+        else:
+            series = [("all", "All", 0, len(fleet))]
+        df_subtree = self.__calc_df_per_subtree(data, commander_id=commander_id).head(n)
+        for c in df_subtree["commander_id"]:
+            series.append((c, fleet.loc[c, "name"], fleet.loc[c, "tin"], fleet.loc[c, "tout"]))
+
+        hour = np.floor(df["time"].to_numpy() / 3600).astype(int)
+        first_hour = int(hour.min()) if len(hour) else 0
+        last_hour = max(int(math.floor(data.game_time / 3600)), first_hour)
+        n_hours = last_hour - first_hour + 1
+
+        # every series is a range of the euler tour
+        value = df["value"].to_numpy()
+        tree_index = df["tree_index"].to_numpy()
+        hourly = []
+        for series_id, name, tin, tout in series:
+            in_series = (tree_index >= tin) & (tree_index < tout)
+            hourly.append(np.bincount(hour[in_series] - first_hour, weights=value[in_series], minlength=n_hours))
+
+        return pd.DataFrame({
+            "series_id": np.repeat([s[0] for s in series], n_hours),
+            "series_name": np.repeat([s[1] for s in series], n_hours),
+            "hour": np.tile(np.arange(first_hour, last_hour + 1), len(series)),
+            "profit": np.concatenate(hourly),
+            "cumulative_profit": np.concatenate([np.cumsum(h) for h in hourly]),
+        })
+
+    # List of (id, name) from the top level commander down to commander_id
+    def get_commander_path(self, commander_id):
+        path = []
+        fleet = self.fleet
+        while commander_id in fleet.index:
+            node = fleet.loc[commander_id]
+            path.insert(0, (commander_id, node["name"]))
+            commander_id = node["parent_id"]
+        return path
+
     # Margekolom en afronding
     @staticmethod
     def __per_x_help(df_perx):
@@ -250,7 +640,32 @@ class X4stats:
         return df_perx
 
     # Loop through all trade transactions to collect transactions where the player is seller or buyer
-    def __calc_sales(self, trades, transfers):
+    def __calc_sales(self, trades, transfers, game_time):
+        sales_list = self.__calc_trade_sales(trades)
+
+        # Add ships with trade/mine orders and stations to make sure they are displayed even without trade value.
+        for ship in self.own_ships:
+            if ship["class"] in (SHIP_CLASSES + PLAYER_CLASSES) or ship["default_order"]:
+                sale = {
+                    "time": game_time,
+                    "ship_id": ship["id"],
+                    "value": 0,
+                    "sales": 0,
+                    "costs": 0,
+                    "volume": 0,
+                    "ware": None,
+                }
+                sales_list = self.__append_sales_list(sales_list, sale)
+
+        # transfers van station accounts
+        account_mutations = self.__calc_account_mutations(transfers=transfers)
+        for m in account_mutations:
+            sales_list = self.__append_sales_list(sales_list, m)
+
+        return self.__sales_df(sales_list, game_time)
+
+    # Sales records of trades where the player is seller or buyer
+    def __calc_trade_sales(self, trades):
         sales_list = []
         for elem in trades:
 
@@ -293,25 +708,9 @@ class X4stats:
                 print(elem)
                 raise
 
-        # Add ships with trade/mine orders and stations to make sure they are displayed even without trade value.
-        for ship in self.own_ships:
-            if ship["class"] in (SHIP_CLASSES + PLAYER_CLASSES) or ship["default_order"]:
-                sale = {
-                    "time": self.game_time,
-                    "ship_id": ship["id"],
-                    "value": 0,
-                    "sales": 0,
-                    "costs": 0,
-                    "volume": 0,
-                    "ware": None,
-                }
-                sales_list = self.__append_sales_list(sales_list, sale)
-
-        # transfers van station accounts
-        account_mutations = self.__calc_account_mutations(transfers=transfers)
-        for m in account_mutations:
-            sales_list = self.__append_sales_list(sales_list, m)
+        return sales_list
 
+    def __sales_df(self, sales_list, game_time):
         df = pd.DataFrame(sales_list)
         # convert certain columns to float
         try:
@@ -324,8 +723,13 @@ class X4stats:
             print(str(e))
             print('No records found. Is the game version >= 4.00?')
             raise
-        # hour passed since event
-        df["hours_since_event"] = df["time"].apply(self.hours_passed)
+        return self.__sort_sales(df, game_time)
+
+    # hours passed since event and sort by time
+    @staticmethod
+    def __sort_sales(df, game_time):
+        df["hours_since_event"] = np.floor((game_time - df["time"]) / 3600).astype(int)
+        df = df.sort_values("time", kind="mergesort").reset_index(drop=True)
 
         # display updated DataFrame
         # print(df)
@@ -342,8 +746,11 @@ class X4stats:
             "ship_class": atts["class"],
             "ship_name": atts["name"],
             "ship_code": atts["code"],
+            "commander_id": atts["commander_id"],
             "commander_name": atts["commander_name"],
             "default_order": atts["default_order"],
+            "tree_index": atts["tin"],
+            "sector": atts["sector"],
             "time": sale["time"],
             "ware": sale["ware"],
             "value": sale["value"],
@@ -356,7 +763,7 @@ class X4stats:
         return sales_list
 
     # Return tuple with players ship/station info and ids
-    def __calc_ship_info(self, assets, connections, orders):
+    def __calc_ship_info(self, assets, connections, orders, locations):
         info = []
         ids = []
         player_id = None
@@ -375,6 +782,7 @@ class X4stats:
                     commander_name = None
                     ship_class = elem["class"]
                     default_order = None
+                    location = {}
 
                     if "macro" in elem:
                         ship_type = elem["macro"]
@@ -386,9 +794,11 @@ class X4stats:
                         name = elem["name"]
                     else:
                         name = code
+                    if ship_id in locations:
+                        location = locations[ship_id]
 
-                    if ship_class in STATION_CLASSES:
-                        # subordinate connections zoeken voor stations
+                    if ship_class in STATION_CLASSES + SHIP_CLASSES:
+                        # subordinate connections zoeken voor stations en vlootcommandanten
                         for con in connections:
                             if con['player_entity'] == ship_id and con['connection_type'] == 'subordinates':
                                 subordinates_cons.append(con['connection_id'])
@@ -411,9 +821,14 @@ class X4stats:
                         "subordinate_cons": subordinates_cons,
                         "commander_cons": commander_cons,
                         "class": ship_class,
+                        "parent_id": None,
                         "commander_id": commander_id,
                         "commander_name": commander_name,
                         "default_order": default_order,
+                        "cluster": location.get("cluster"),
+                        "sector": location.get("sector"),
+                        "zone": location.get("zone"),
+                        "lost": False,
                     })
                     ids.append(ship_id)
 
@@ -424,15 +839,20 @@ class X4stats:
                     print(str(e))
                     print(elem)
 
-        # stations aan schepen verbinden
+        # subordinate connection -> commanderende station of schip
+        subordinate_con_owners = {}
+        for c in info:
+            for con in c["subordinate_cons"]:
+                subordinate_con_owners[con] = c
+
+        # stations en schepen aan schepen verbinden
         for e in info:
             # schip heeft 1 commander
-            if len(e["commander_cons"]) == 1:
-                # zoek commander id
-                for c in info:
-                    if e["commander_cons"][0] in c["subordinate_cons"]:
-                        e["commander_id"] = c["id"]
-                        e["commander_name"] = c["name"]
+            if len(e["commander_cons"]) == 1 and e["commander_cons"][0] in subordinate_con_owners:
+                c = subordinate_con_owners[e["commander_cons"][0]]
+                e["parent_id"] = c["id"]
+                e["commander_id"] = c["id"]
+                e["commander_name"] = c["name"]
             else:
                 # Bij geen commander ben je eigen baas tbv groepering per commander
                 e["commander_id"] = e["id"]
@@ -442,6 +862,62 @@ class X4stats:
         #     print(i)
         return info, ids, player_id
 
+    # Lay out the command hierarchy as an euler tour. Every asset gets an entry index tin and exit index tout so
+    # that the asset and all of its (indirect) subordinates occupy positions tin up to tout in the tour.
+    @staticmethod
+    def __calc_fleet_tree(info):
+        children = {e["id"]: [] for e in info}
+        roots = []
+        for e in info:
+            if e["parent_id"] in children:
+                children[e["parent_id"]].append(e)
+            else:
+                e["parent_id"] = None
+                roots.append(e)
+        for c in children.values():
+            c.sort(key=lambda x: (str(x["name"]), x["id"]))
+        roots.sort(key=lambda x: (str(x["name"]), x["id"]))
+
+        position = 0
+        visited = set()
+        # Assets not reachable from a root are part of a commander loop and become a root themselves
+        for root in roots + [e for e in info if e["parent_id"] is not None]:
+            if root["id"] in visited:
+                continue
+            root["parent_id"] = None
+            stack = [(root, 0, False)]
+            while stack:
+                e, depth, leaving = stack.pop()
+                if leaving:
+                    e["tout"] = position
+                    continue
+                if e["id"] in visited:
+                    continue
+                visited.add(e["id"])
+                e["tin"] = position
+                e["depth"] = depth
+                position = position + 1
+                stack.append((e, depth, True))
+                for c in reversed(children[e["id"]]):
+                    stack.append((c, depth + 1, False))
+
+        fleet = pd.DataFrame([{
+            "id": e["id"],
+            "name": e["name"],
+            "code": e["code"],
+            "class": e["class"],
+            "parent_id": e["parent_id"],
+            "depth": e["depth"],
+            "tin": e["tin"],
+            "tout": e["tout"],
+            "cluster": e["cluster"],
+            "sector": e["sector"],
+            "zone": e["zone"],
+            "lost": e["lost"],
+        } for e in info], columns=["id", "name", "code", "class", "parent_id", "depth", "tin", "tout", "cluster", "sector"
+                                   , "zone", "lost"])
+        return fleet.set_index("id")
+
     def get_id_attributes(self, ship_id):
         for c in self.own_ships:
             if c["id"] == ship_id:
@@ -454,9 +930,25 @@ class X4stats:
     def get_profit(self, df):
         return df["value"].sum()
 
-    # Schepen zonder trades, maar met trade orders
-    def get_inactive_ships(self, hours):
-        return None
+    # Schepen zonder trades in de laatste X uren, maar met trade orders. Sorted with the longest inactive ships first,
+    # ships which never traded on top.
+    def get_inactive_ships(self, hours=None):
+        data = self.data
+        df = data.activity.loc[
+            (data.activity["default_order"].isin(ECO_ORDERS))
+            & (data.activity["ship_class"].isin(SHIP_CLASSES))
+        ].copy()
+        df["hours_since_last_trade"] = np.floor((data.game_time - df["last_trade_time"]) / 3600)
+        # trades per hour since the first trade
+        active_hours = np.maximum((data.game_time - df["first_trade_time"]) / 3600, 1)
+        df["trades_per_hour"] = (df["trades"] / active_hours).fillna(0).round(2)
+        if hours:
+            # uren beginnen te tellen bij 0, zie get_df_sales
+            inactive = df["hours_since_last_trade"].isna() | (df["hours_since_last_trade"] > int(hours) - 1)
+        else:
+            inactive = df["hours_since_last_trade"].isna()
+        df = df.loc[inactive].reset_index()
+        return df.sort_values("hours_since_last_trade", ascending=False, na_position="first")
 
     # Transacties per id
     def __calc_account_mutations(self, transfers):